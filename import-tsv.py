@@ -1,12 +1,29 @@
 #!/usr/bin/env python3
+import io
+import atexit
+import csv
 import os
 import sys
 import glob
+import itertools
 import psycopg2
+from psycopg2.extras import execute_batch, execute_values
+from tqdm import tqdm
 import argparse
+from functools import partial
+import multiprocessing
 from datetime import datetime
 
 
+# Header line prefixes and the metadata keys they map to
+METADATA_PREFIXES = (
+    ('# Software:', 'software_version'),
+    ('# Database:', 'database_version'),
+    ('# DOI:', 'doi'),
+    ('# URL:', 'url'),
+)
+
+
 def parse_metadata(lines):
     """Extract metadata from header lines"""
     metadata = {
@@ -18,30 +35,52 @@ def parse_metadata(lines):
     }
     
     for line in lines:
-        if line.startswith('# Software:'):
-            metadata['software_version'] = line.replace('# Software:', '').strip()
-        elif line.startswith('# Database:'):
-            parts = line.replace('# Database:', '').strip().split(',')
-            if len(parts) >= 1:
-                metadata['database_version'] = parts[0].strip()
-            if len(parts) >= 2:
-                metadata['database_type'] = parts[1].strip()
-        elif line.startswith('# DOI:'):
-            metadata['doi'] = line.replace('# DOI:', '').strip()
-        elif line.startswith('# URL:'):
-            metadata['url'] = line.replace('# URL:', '').strip()
+        for prefix, key in METADATA_PREFIXES:
+            if line.startswith(prefix):
+                value = line.removeprefix(prefix).strip()
+                if key == 'database_version':
+                    # e.g. "v6.0, light"
+                    version, _, db_type = value.partition(',')
+                    metadata['database_version'] = version.strip()
+                    metadata['database_type'] = db_type.partition(',')[0].strip()
+                else:
+                    metadata[key] = value
+                break
     
     return metadata
 
 
+def _iter_annotations(file_path):
+    """Yield annotation tuples from the data rows of a Bakta TSV file"""
+    # The file is opened on the first row requested and closed once the rows run out
+    with open(file_path, 'r', newline='') as f:
+        for parts in csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE):
+            # Skip comments and rows missing the main fields
+            if len(parts) >= 8 and not parts[0].startswith('#'):
+                # Positions stay as text for COPY; only check they are numeric
+                if not (parts[2].isdigit() and parts[3].isdigit()):
+                    raise ValueError(f"Invalid position in {parts[0]}: {parts[2]}-{parts[3]}")
+                # Tuples in annotations column order, rather than a dict per row
+                yield (
+                    parts[0],  # sequence_id
+                    parts[1],  # feature_type
+                    parts[2],  # start_position
+                    parts[3],  # stop_position
+                    parts[4],  # strand
+                    # Empty fields stay '' and are stored as NULL by the import
+                    parts[5],  # locus_tag
+                    parts[6],  # gene
+                    parts[7],  # product
+                    # Kept as the raw comma-separated string; split only where a list is needed
+                    parts[8] if len(parts) > 8 else ''  # dbxrefs
+                )
+
+
 def parse_tsv_file(file_path):
-    """Parse a Bakta TSV file and return metadata and annotations"""
+    """Parse a Bakta TSV file and return metadata and a lazy iterator of annotations"""
+    # Metadata lines may appear anywhere in the file, so collect them in a separate pass
     with open(file_path, 'r') as f:
-        lines = f.readlines()
-    
-    # Separate header and data lines
-    header_lines = [line for line in lines if line.startswith('#')]
-    data_lines = [line for line in lines if not line.startswith('#')]
+        header_lines = [line for line in f if line.startswith('#')]
     
     # Extract sample_id from filename (without extension)
     sample_id = os.path.splitext(os.path.basename(file_path))[0]
@@ -51,46 +90,51 @@ def parse_tsv_file(file_path):
     metadata['sample_id'] = sample_id
     metadata['file_path'] = file_path
     
-    # Parse annotations
-    annotations = []
-    for line in data_lines:
-        if not line.strip():
-            continue
-            
-        parts = line.strip().split('\t')
-        if len(parts) < 8:  # Ensure we have at least the main fields
-            continue
-            
-        annotation = {
-            'sequence_id': parts[0],
-            'feature_type': parts[1],
-            'start_position': int(parts[2]),
-            'stop_position': int(parts[3]),
-            'strand': parts[4],
-            'locus_tag': parts[5] if parts[5] else None,
-            'gene': parts[6] if parts[6] else None,
-            'product': parts[7] if parts[7] else None,
-            'dbxrefs': parts[8].split(', ') if len(parts) > 8 and parts[8] else []
-        }
-        annotations.append(annotation)
-    
-    return metadata, annotations
-
-
-def import_to_database(conn, metadata, annotations):
-    """Import metadata and annotations to the PostgreSQL database"""
+    # Data rows are parsed as they are consumed
+    return metadata, _iter_annotations(file_path)
+
+
+def _tsv_to_pg_array(dbxrefs):
+    """Render a comma-separated DbXrefs field as a PostgreSQL array literal"""
+    if not dbxrefs:
+        return None
+    # Xrefs almost never need escaping, so only rewrite the string when they do
+    if '\\' in dbxrefs or '"' in dbxrefs:
+        dbxrefs = dbxrefs.replace('\\', '\\\\').replace('"', '\\"')
+    return '{"' + dbxrefs.replace(', ', '","') + '"}'
+
+
+# Connections that already have ins_annot prepared. A prepared statement lasts for the
+# session and survives a rollback of the transaction that created it
+_prepared_conns = set()
+
+
+def _prepare_annotation_insert(conn, cursor):
+    """Prepare the annotations INSERT used by the fallback path, once per connection"""
+    if conn not in _prepared_conns:
+        cursor.execute("""
+            PREPARE ins_annot (int, text, text, int, int, text, text, text, text, text) AS
+            INSERT INTO annotations
+            (genome_id, sequence_id, feature_type, start_position, stop_position,
+            strand, locus_tag, gene, product, dbxrefs)
+            VALUES ($1, $2, $3, $4, $5, $6, NULLIF($7, ''), NULLIF($8, ''), NULLIF($9, ''),
+            NULLIF(string_to_array($10, ', '), '{}'))
+        """)
+        _prepared_conns.add(conn)
+
+
+def import_batch_to_database(conn, batch, use_copy=True):
+    """Import several (metadata, annotations) pairs in one transaction, returning the annotation count of each"""
+    # psycopg2 opens the transaction implicitly with the first statement
     cursor = conn.cursor()
     
     try:
-        # Start transaction
-        cursor.execute("BEGIN")
-        
-        # Insert genome data and get its ID
-        cursor.execute("""
+        # Insert genome data and get their IDs, in the same order as the batch
+        genome_ids = [row[0] for row in execute_values(cursor, """
             INSERT INTO genomes (sample_id, software_version, database_version, database_type, doi, url, file_path)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            VALUES %s
             RETURNING id
-        """, (
+        """, [(
             metadata['sample_id'],
             metadata['software_version'],
             metadata['database_version'],
@@ -98,51 +142,197 @@ def import_to_database(conn, metadata, annotations):
             metadata['doi'],
             metadata['url'],
             metadata['file_path']
-        ))
-        
-        genome_id = cursor.fetchone()[0]
+        ) for metadata, _ in batch], page_size=len(batch), fetch=True)]
         
-        # Insert annotations in batches for efficiency
-        batch_size = 1000
-        for i in range(0, len(annotations), batch_size):
-            batch = annotations[i:i+batch_size]
-            
-            values_str = []
-            values_list = []
-            
-            for annot in batch:
-                values_str.append("(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)")
-                values_list.extend([
-                    genome_id,
-                    annot['sequence_id'],
-                    annot['feature_type'],
-                    annot['start_position'],
-                    annot['stop_position'],
-                    annot['strand'],
-                    annot['locus_tag'],
-                    annot['gene'],
-                    annot['product'],
-                    annot['dbxrefs'] if annot['dbxrefs'] else None
-                ])
-            
-            query = f"""
-                INSERT INTO annotations 
-                (genome_id, sequence_id, feature_type, start_position, stop_position, 
+        counts = []
+        if use_copy:
+            # Stream the annotations of every file to the server with a single COPY.
+            # Every field is quoted, so empty fields arrive as '' and only the
+            # FORCE_NULL columns turn them into NULL, matching the INSERT fallback
+            buf = io.StringIO()
+            writer = csv.writer(buf, lineterminator='\n', quoting=csv.QUOTE_ALL)
+            for genome_id, (_, annotations) in zip(genome_ids, batch):
+                # Rows go straight from the parser into the buffer; zip advances the
+                # counter once per annotation, so it ends up holding the file's count
+                counter = itertools.count()
+                writer.writerows(
+                    (genome_id, *annot[:8], _tsv_to_pg_array(annot[8]))
+                    for annot, _ in zip(annotations, counter)
+                )
+                counts.append(next(counter))
+
+            buf.seek(0)
+            cursor.copy_expert("""
+                COPY annotations
+                (genome_id, sequence_id, feature_type, start_position, stop_position,
                 strand, locus_tag, gene, product, dbxrefs)
-                VALUES {', '.join(values_str)}
-            """
-            
-            cursor.execute(query, values_list)
+                FROM STDIN WITH (FORMAT csv, FORCE_NULL (locus_tag, gene, product, dbxrefs))
+            """, buf)
+        else:
+            # Fall back to a prepared INSERT (e.g. when COPY is undesirable because of triggers)
+            _prepare_annotation_insert(conn, cursor)
+            for genome_id, (_, annotations) in zip(genome_ids, batch):
+                counter = itertools.count()
+                execute_batch(
+                    cursor,
+                    "EXECUTE ins_annot (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                    (
+                        (genome_id, annot[0], annot[1], int(annot[2]), int(annot[3]), *annot[4:])
+                        for annot, _ in zip(annotations, counter)
+                    ),
+                    page_size=1000
+                )
+                counts.append(next(counter))
         
         # Commit the transaction
-        cursor.execute("COMMIT")
+        conn.commit()
+        return counts
         
-    except Exception as e:
-        cursor.execute("ROLLBACK")
-        print(f"Error during database import: {e}")
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def import_to_database(conn, metadata, annotations, use_copy=True):
+    """Import metadata and annotations to the PostgreSQL database, returning the annotation count"""
+    return import_batch_to_database(conn, [(metadata, annotations)], use_copy=use_copy)[0]
+
+
+# Secondary indexes on annotations that are dropped during a --bulk load
+ANNOTATION_INDEXES = (
+    ('idx_annotations_sequence_id', 'sequence_id'),
+    ('idx_annotations_feature_type', 'feature_type'),
+    ('idx_annotations_locus_tag', 'locus_tag'),
+    ('idx_annotations_gene', 'gene'),
+)
+
+
+def start_bulk_load(conn, drop_indexes=True, unlogged=False):
+    """Drop the secondary annotation indexes and, optionally, WAL logging ahead of a bulk load"""
+    cursor = conn.cursor()
+    try:
+        if unlogged:
+            # Applies to the whole table: a crash before finish_bulk_load truncates it
+            cursor.execute("ALTER TABLE annotations SET UNLOGGED")
+        if drop_indexes:
+            for name, _ in ANNOTATION_INDEXES:
+                cursor.execute(f"DROP INDEX IF EXISTS {name}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
         raise
 
 
+def finish_bulk_load(conn, rebuild_indexes=True, unlogged=False):
+    """Restore WAL logging and rebuild the secondary annotation indexes after a bulk load"""
+    cursor = conn.cursor()
+    try:
+        if unlogged:
+            cursor.execute("ALTER TABLE annotations SET LOGGED")
+        if rebuild_indexes:
+            # Give the index builds more memory for this transaction only
+            cursor.execute("SET LOCAL maintenance_work_mem = '2GB'")
+            for name, column in ANNOTATION_INDEXES:
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON annotations ({column})")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def iter_tsv_files(folder, pattern='*.tsv'):
+    """Yield the paths of the files in folder matching pattern"""
+    suffix = pattern[1:] if pattern.startswith('*') else pattern
+    if not pattern.startswith('*') or any(c in suffix for c in '*?['):
+        yield from glob.iglob(os.path.join(folder, pattern))
+        return
+    
+    # Plain "*<suffix>" patterns only need a suffix test on each directory entry
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.name.endswith(suffix) and not entry.name.startswith('.') and entry.is_file():
+                yield entry.path
+
+
+def _group_sizes(batch_size, workers):
+    """Yield group sizes that start small, so every worker gets files early, and double up to batch_size"""
+    size = 1
+    while size < batch_size:
+        yield from itertools.repeat(size, workers)
+        size *= 2
+    yield from itertools.repeat(batch_size)
+
+
+def _chunked(iterable, sizes):
+    """Yield lists of items from iterable, sized by the successive values of sizes"""
+    iterator = iter(iterable)
+    for size in sizes:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Connection owned by each worker process, opened by _connect_worker
+_worker_conn = None
+_worker_connect_error = None
+
+
+def _connect_worker(connect_kwargs):
+    """Open the database connection used by a worker process"""
+    global _worker_conn, _worker_connect_error
+    try:
+        _worker_conn = psycopg2.connect(**connect_kwargs)
+    except Exception as e:
+        # Raising here would make the pool restart the worker forever; report it per file instead
+        _worker_connect_error = e
+        return
+    _worker_conn.autocommit = False
+    atexit.register(_worker_conn.close)
+
+
+def _ingest_group(file_paths, use_copy=True):
+    """
+    Parse and import a group of files in one transaction, retrying them one by one on failure.
+    
+    Returns a notice for the main process (or None) and a (file_path, count, error) result per file.
+    """
+    if _worker_conn is None:
+        error = f"Error connecting to database: {str(_worker_connect_error).strip()}"
+        return None, [(file_path, None, error) for file_path in file_paths]
+    
+    notice = None
+    if len(file_paths) > 1:
+        try:
+            batch = [parse_tsv_file(file_path) for file_path in file_paths]
+            counts = import_batch_to_database(_worker_conn, batch, use_copy=use_copy)
+            return None, [(file_path, count, None) for file_path, count in zip(file_paths, counts)]
+        except Exception:
+            notice = f"  Batch of {len(file_paths)} files failed, importing them individually"
+    
+    results = []
+    for file_path in file_paths:
+        try:
+            metadata, annotations = parse_tsv_file(file_path)
+            count = import_to_database(_worker_conn, metadata, annotations, use_copy=use_copy)
+            results.append((file_path, count, None))
+        except Exception as e:
+            results.append((file_path, None, str(e)))
+    
+    return notice, results
+
+
+def _positive_int(value):
+    """argparse type for options that need a count of at least 1"""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
 def main():
     parser = argparse.ArgumentParser(description='Import Bakta annotation TSV files into PostgreSQL database')
     parser.add_argument('--folder', help='Folder containing Bakta TSV files')
@@ -152,50 +342,87 @@ def main():
     parser.add_argument('--db-host', default='localhost', help='PostgreSQL host')
     parser.add_argument('--db-port', default='5432', help='PostgreSQL port')
     parser.add_argument('--pattern', default='*.tsv', help='File pattern to match TSV files')
+    parser.add_argument('--no-copy', action='store_true', help='Insert annotations with INSERT statements instead of COPY')
+    parser.add_argument('--workers', type=_positive_int, default=4, help='Number of worker processes, each with its own database connection')
+    parser.add_argument('--batch-size', type=_positive_int, default=50, help='Number of files imported per transaction')
+    parser.add_argument('--bulk', action='store_true', help='Drop annotation indexes during the import and rebuild them afterwards')
+    parser.add_argument('--unlogged', action='store_true',
+                        help='Make the annotations table UNLOGGED during the import. If the server crashes meanwhile, '
+                             'ALL annotations, including previously imported ones, are lost. The whole table is '
+                             'rewritten twice, so only use this when loading into an empty or disposable table')
     
     args = parser.parse_args()
     
     # Connect to PostgreSQL database
+    connect_kwargs = {
+        'dbname': args.db_name,
+        'user': args.db_user,
+        'password': args.db_password,
+        'host': args.db_host,
+        'port': args.db_port
+    }
     try:
-        conn = psycopg2.connect(
-            dbname=args.db_name,
-            user=args.db_user,
-            password=args.db_password,
-            host=args.db_host,
-            port=args.db_port
-        )
+        conn = psycopg2.connect(**connect_kwargs)
+        conn.autocommit = False
     except Exception as e:
-        print(f"Error connecting to database: {e}")
+        print(f"Error connecting to database: {e}", file=sys.stderr)
         sys.exit(1)
     
-    # Find all TSV files in the specified folder
+    # Find the TSV files in the specified folder, lazily so the import can start right away
     folder_path = os.path.abspath(args.folder)
-    file_pattern = os.path.join(folder_path, args.pattern)
-    tsv_files = glob.glob(file_pattern)
+    tsv_files = iter_tsv_files(folder_path, args.pattern)
+    first_file = next(tsv_files, None)
     
-    if not tsv_files:
-        print(f"No TSV files found in {folder_path} matching pattern {args.pattern}")
+    if first_file is None:
+        print(f"No TSV files found in {folder_path} matching pattern {args.pattern}", file=sys.stderr)
         sys.exit(1)
     
-    print(f"Found {len(tsv_files)} TSV files to import")
+    print(f"Importing TSV files from {folder_path}")
+    
+    if args.bulk or args.unlogged:
+        print("Preparing annotations table for bulk load")
+        start_bulk_load(conn, drop_indexes=args.bulk, unlogged=args.unlogged)
+    
+    # Split the files into per-transaction groups as they are found
+    groups = _chunked(
+        itertools.chain((first_file,), tsv_files), _group_sizes(args.batch_size, args.workers)
+    )
     
-    # Process each file
     success_count = 0
     error_count = 0
+    annotation_count = 0
     
-    for i, file_path in enumerate(tsv_files, 1):
-        try:
-            print(f"[{i}/{len(tsv_files)}] Processing {os.path.basename(file_path)}")
-            metadata, annotations = parse_tsv_file(file_path)
-            import_to_database(conn, metadata, annotations)
-            print(f"  Imported {len(annotations)} annotations")
-            success_count += 1
-        except Exception as e:
-            print(f"  Error processing {file_path}: {e}")
-            error_count += 1
+    try:
+        # Each worker parses its group and imports it over its own connection; spawn them
+        # rather than fork so they don't inherit this process's connection
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(args.workers, initializer=_connect_worker, initargs=(connect_kwargs,)) as pool:
+            ingest = partial(_ingest_group, use_copy=not args.no_copy)
+            with tqdm(unit='file') as pbar:
+                for notice, results in pool.imap_unordered(ingest, groups):
+                    if notice:
+                        tqdm.write(notice, file=sys.stderr)
+                    for file_path, count, error in results:
+                        if error is None:
+                            success_count += 1
+                            annotation_count += count
+                        else:
+                            error_count += 1
+                            tqdm.write(f"  Error processing {file_path}: {error}", file=sys.stderr)
+                    pbar.update(len(results))
+                    pbar.set_postfix(ok=success_count, err=error_count, annotations=annotation_count)
+            
+            # Let the workers exit normally so they close their connections
+            pool.close()
+            pool.join()
+    finally:
+        if args.bulk or args.unlogged:
+            print("Restoring annotations table after bulk load")
+            finish_bulk_load(conn, rebuild_indexes=args.bulk, unlogged=args.unlogged)
     
     conn.close()
-    print(f"Import completed. Successfully processed {success_count} files. Failed: {error_count} files.")
+    print(f"Import completed. Successfully processed {success_count} files "
+          f"({annotation_count} annotations). Failed: {error_count} files.")
 
 
 if __name__ == "__main__":
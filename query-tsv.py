@@ -1,3 +1,4 @@
+import asyncio
 import getpass
 import os
 import sys
@@ -46,23 +47,23 @@ class QueryOutput(TypedDict):
 
     query: Annotated[str, ..., "Syntactically valid SQL query."]
 
+# The schema is static for the session, so render it into the prompt once
+query_prompt = query_prompt_template.partial(
+    dialect=db.dialect, top_k=10, table_info=db.get_table_info()
+)
+
+structured_llm = llm.with_structured_output(QueryOutput)
+
+execute_query_tool = QuerySQLDatabaseTool(db=db)
+
 def write_query(state: State):
     """Generate SQL query to fetch information."""
-    prompt = query_prompt_template.invoke(
-        {
-            "dialect": db.dialect,
-            "top_k": 10,
-            "table_info": db.get_table_info(),
-            "input": state["question"],
-        }
-    )
-    structured_llm = llm.with_structured_output(QueryOutput)
+    prompt = query_prompt.invoke({"input": state["question"]})
     result = structured_llm.invoke(prompt)
     return {"query": result["query"]}
 
 def execute_query(state: State):
     """Execute SQL query."""
-    execute_query_tool = QuerySQLDatabaseTool(db=db)
     return {"result": execute_query_tool.invoke(state["query"])}
 
 
@@ -84,7 +85,16 @@ graph_builder = StateGraph(State).add_sequence(
 graph_builder.add_edge(START, "write_query")
 graph = graph_builder.compile()
 
-for step in graph.stream(
-    {"question": " ".join(sys.argv[1:])}, stream_mode="updates"
-):
-    print(step)
\ No newline at end of file
+async def run(question):
+    """Print the generated SQL query, then stream the answer as it is generated."""
+    async for event in graph.astream_events({"question": question}, version="v2"):
+        if event["event"] == "on_chain_end" and event["name"] == "write_query":
+            print(f'SQL Query: {event["data"]["output"]["query"]}\n')
+        elif (
+            event["event"] == "on_chat_model_stream"
+            and event["metadata"].get("langgraph_node") == "generate_answer"
+        ):
+            print(event["data"]["chunk"].content, end="", flush=True)
+    print()
+
+asyncio.run(run(" ".join(sys.argv[1:])))
@@ -1,7 +1,99 @@
 #!/usr/bin/env python3
+import io
 import os
+import re
 import sys
 import psycopg2
+import sqlparse
+from sqlparse import tokens
+
+# Statements whose data follows them in the file, terminated by a "\." line
+COPY_FROM_STDIN = re.compile(r'^\s*COPY\b.*\bFROM\s+STDIN\b', re.IGNORECASE | re.DOTALL)
+
+
+def iter_sql_statements(file):
+    """
+    Yield the statements of an SQL file as they are read.
+    
+    Args:
+        file: Open SQL file
+    
+    Yields:
+        tuple: (line number, statement, COPY data buffer or None)
+    """
+    lines = enumerate(file, 1)
+    pending = []
+    start_line = 1
+    
+    def split_pending(text):
+        """Yield (offset, line number, statement, statement without comments) for text"""
+        try:
+            statements = sqlparse.split(text)
+        except sqlparse.exceptions.SQLParseError as e:
+            raise sqlparse.exceptions.SQLParseError(f"{e} in the statements from line {start_line}") from e
+        pos = 0
+        for statement in statements:
+            pos = text.find(statement, pos)
+            # Number statements from their first line of code, not the comments above it,
+            # and drop the comments from the code (sqlparse.format fails on large statements)
+            code_offset = None
+            offset = 0
+            code = []
+            for ttype, value in sqlparse.lexer.tokenize(statement):
+                if ttype in tokens.Comment:
+                    code.append(' ')
+                else:
+                    if code_offset is None and ttype not in tokens.Whitespace:
+                        code_offset = offset
+                    code.append(value)
+                offset += len(value)
+            line_number = start_line + text.count('\n', 0, pos + (code_offset or 0))
+            yield pos, line_number, statement, ''.join(code).strip()
+            pos += len(statement)
+    
+    for line_number, line in lines:
+        if not pending:
+            if not line.strip():
+                continue
+            start_line = line_number
+        pending.append(line)
+        
+        # Only try to split once a line could end a statement
+        if ';' not in line:
+            continue
+        text = ''.join(pending)
+        if any(ttype in tokens.Error for ttype, _ in sqlparse.lexer.tokenize(text)):
+            # Still inside a quoted string or function body
+            continue
+        statements = list(split_pending(text))
+        pending = []
+        
+        # A statement that starts after the last semicolon stays pending
+        if statements and not statements[-1][3].endswith(';'):
+            offset = statements.pop()[0]
+            pending = [text[offset:]]
+            start_line += text.count('\n', 0, offset)
+        
+        for _, statement_line, statement, code in statements:
+            if not code:
+                # Only comments
+                continue
+            if COPY_FROM_STDIN.match(code):
+                data = io.StringIO()
+                for _, data_line in lines:
+                    if data_line.rstrip('\r\n') == '\\.':
+                        break
+                    data.write(data_line)
+                data.seek(0)
+                yield statement_line, code, data
+            else:
+                yield statement_line, statement, None
+    
+    # Last statement without a trailing semicolon
+    for _, statement_line, statement, code in split_pending(''.join(pending)):
+        if code:
+            yield statement_line, statement, None
+
 
 def run_sql_file(connection_string, sql_file_path):
     """
@@ -15,26 +107,36 @@ def run_sql_file(connection_string, sql_file_path):
         print(f"Error: SQL file '{sql_file_path}' not found.")
         sys.exit(1)
     
+    conn = None
+    cursor = None
+    line_number = None
     try:
-        # Read SQL file
-        with open(sql_file_path, 'r') as file:
-            sql_script = file.read()
-        
         # Connect to the database
         print(f"Connecting to database...")
         conn = psycopg2.connect(connection_string)
         cursor = conn.cursor()
         
-        # Execute the SQL script
+        # Execute the SQL file statement by statement in a single transaction
         print(f"Executing SQL from file: {sql_file_path}")
-        cursor.execute(sql_script)
+        with open(sql_file_path, 'r') as file:
+            for line_number, statement, copy_data in iter_sql_statements(file):
+                if copy_data is None:
+                    cursor.execute(statement)
+                else:
+                    cursor.copy_expert(statement, copy_data)
         
         # Commit the changes
         conn.commit()
         print("SQL script executed successfully!")
         
     except psycopg2.Error as e:
-        print(f"Database error: {e}")
+        location = f" at line {line_number}" if line_number else ""
+        print(f"Database error{location}: {e}")
+        if conn:
+            conn.rollback()
+        sys.exit(1)
+    except sqlparse.exceptions.SQLParseError as e:
+        print(f"SQL parse error: {e}")
         if conn:
             conn.rollback()
         sys.exit(1)